@@ -1,41 +1,57 @@
-import os
-import sys
 import json
-import copy
+from argparse import ArgumentParser
 
-before = sys.argv[1]
-after = sys.argv[2]
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-with open(before, 'r', encoding='utf-8') as fin:
-    before_data = json.load(fin)
 
-with open(after, 'r', encoding='utf-8') as fin:
-    after_data = json.load(fin)
+def load_json(path):
+    if orjson is not None:
+        with open(path, 'rb') as fin:
+            return orjson.loads(fin.read())
+    with open(path, 'r', encoding='utf-8') as fin:
+        return json.load(fin)
+
+
+def dumps(obj, pretty):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else None)
+    if pretty:
+        return json.dumps(obj, indent=2).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def connection_key(item):
+    return f"{item['source_id']} -> {item['target_id']}({item['type']}:{item['direction']})"
+
+
+# 2行目以降を字下げして書き出す (replaceで字下げ済みのコピーを作らず、行単位で書く)
+def write_indented(fout, body, indent=b'  '):
+    view = memoryview(body)
+    start = 0
+    while (end := body.find(b'\n', start)) != -1:
+        fout.write(view[start:end + 1])
+        fout.write(indent)
+        start = end + 1
+    fout.write(view[start:])
+
+
+parser = ArgumentParser(description='Diff two ros2_state_dumper.py JSON dumps into ./diff_result.json')
+parser.add_argument('before', type=str, help="json file (before)")
+parser.add_argument('after', type=str, help="json file (after)")
+parser.add_argument('--pretty', action='store_true', help="indent the output json")
+args = parser.parse_args()
+
+before_data = load_json(args.before)
+after_data = load_json(args.after)
 
 
 
 diff_map = {
-    'missing': {
-        'topics': [],
-        "nodes": [],
-        "services": [],
-        'param': [],
-        'connections': [],
-    },
-    'add': {
-        'topics': [],
-        "nodes": [],
-        "services": [],
-        'param': [],
-        'connections': [],
-    },
-    'change': {
-        'topics': [],
-        "nodes": [],
-        "services": [],
-        'param': [],
-        'connections': [],
-    },
+    bucket: {k: [] for k in ['topics', 'nodes', 'services', 'param', 'connections']}
+    for bucket in ('missing', 'add', 'change')
 }
 
 keys = [
@@ -50,46 +66,50 @@ for key in keys:
     after = after_data[key]
 
     if key in ['nodes', 'topics', 'services']:
-        before_names = before.keys()
-        after_names = after.keys()
+        before_map = before
+        after_map = after
     else:
-        before_names = [f"{item['source_id']} -> {item['target_id']}({item['type']}:{item['direction']})"  for item in before]
-        after_names = [f"{item['source_id']} -> {item['target_id']}({item['type']}:{item['direction']})"  for item in after]
+        before_map = {connection_key(item): item for item in before}
+        after_map = {connection_key(item): item for item in after}
+
+    b_keys = before_map.keys()
+    a_keys = after_map.keys()
+
+    diff_map['missing'][key].extend(sorted(b_keys - a_keys))
+    diff_map['add'][key].extend(sorted(a_keys - b_keys))
+
+    if key == 'nodes':
+        diff_map['missing']['param'].extend(
+            f"[{b_n}]: {p['name']}" for b_n in diff_map['missing'][key] for p in before_map[b_n]['parameters'])
+        diff_map['add']['param'].extend(
+            f"[{a_n}]: {p['name']}" for a_n in diff_map['add'][key] for p in after_map[a_n]['parameters'])
+
+        for n in sorted(b_keys & a_keys):
+            before_param_map = {b_p['name']: b_p['value'] for b_p in before_map[n]['parameters']}
+            after_param_map = {a_p['name']: a_p['value'] for a_p in after_map[n]['parameters']}
+            b_p_names = before_param_map.keys()
+            a_p_names = after_param_map.keys()
+            diff_map['missing']['param'].extend(f"[{n}]: {p_name}" for p_name in sorted(b_p_names - a_p_names))
+            diff_map['change']['param'].extend(
+                f"[{n}: {p_name}] {before_param_map[p_name]} -> {after_param_map[p_name]}"
+                for p_name in sorted(b_p_names & a_p_names)
+                if before_param_map[p_name] != after_param_map[p_name])
+            diff_map['add']['param'].extend(f"[{n}]: {p_name}" for p_name in sorted(a_p_names - b_p_names))
 
-    for idx_before, b_n in enumerate(before_names):
+# 入力データはもう不要なので書き出し前に解放する
+del before_data, after_data, before, after, before_map, after_map
 
-        if not b_n in after_names:
-            diff_map['missing'][key].append(b_n)
-            if key == 'nodes':
-                params = before[b_n]['parameters']
-                for p in params:
-                    diff_map['missing']['param'].append(f"[{b_n}]: {p['name']}")
+# カテゴリ(missing/add/change)ごとにシリアライズして書き出し、書いたものから手放す
+with open("./diff_result.json", 'wb') as fout:
+    fout.write(b'{')
+    for idx, bucket in enumerate(list(diff_map)):
+        body = dumps(diff_map.pop(bucket), args.pretty)
+        if idx > 0:
+            fout.write(b',')
+        if args.pretty:
+            fout.write(f'\n  "{bucket}": '.encode('utf-8'))
+            write_indented(fout, body)
         else:
-            if key == 'nodes':
-                before_params = before[b_n]['parameters']
-                before_param_names = [b_p['name'] for b_p in before_params]
-                after_params = after[b_n]['parameters']
-                after_param_names = [b_p['name'] for b_p in after_params]
-                for b_p_name in before_param_names:
-                    if not b_p_name in after_param_names:
-                        diff_map['missing']['param'].append(f"[{b_n}]: {b_p_name}")
-                    else:
-                        b_p = list(filter(lambda x: x['name'] == b_p_name, before_params))[0]
-                        a_p = list(filter(lambda x: x['name'] == b_p_name, after_params))[0]
-                        if b_p['value'] != a_p['value']:
-                            diff_map['change']['param'].append(f"[{b_n}: {b_p_name}] {b_p['value']} -> {a_p['value']}")
-                for a_p_name in after_param_names:
-                    if not a_p_name in before_param_names:
-                        diff_map['add']['param'].append(f"[{b_n}]: {a_p_name}")
-    for idx_after, a_n in enumerate(after_names):
-
-        if not a_n in before_names:
-            diff_map['add'][key].append(a_n)
-            if key == 'nodes':
-                params = after[a_n]['parameters']
-                for p in params:
-                    diff_map['add']['param'].append(f"[{a_n}]: {p['name']}")
-
-
-with open("./diff_result.json", 'w', encoding='utf-8') as fout:
-    json.dump(diff_map, fout, indent=2)
\ No newline at end of file
+            fout.write(f'"{bucket}":'.encode('utf-8'))
+            fout.write(body)
+    fout.write(b'\n}' if args.pretty else b'}')
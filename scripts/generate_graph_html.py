@@ -1,9 +1,19 @@
 import json
+import functools
 from jinja2 import Template
 import os
 from argparse import ArgumentParser
+try:
+   import orjson
+except ImportError:
+   orjson = None
 base = os.path.dirname(os.path.abspath(__file__))
 
+@functools.lru_cache(maxsize=1)
+def _get_template():
+   with open(os.path.abspath(os.path.join(base, './temp/ros2_graph_template.html')), 'r', encoding='utf-8') as fin:
+      return Template(source=fin.read(), trim_blocks=True, lstrip_blocks=True)
+
 def main():
    parser = ArgumentParser(description='hoge')
    parser.add_argument('file', type=str, help="json file")
@@ -13,13 +23,21 @@ def main():
    save_dir = os.path.abspath(args.output_dir)
    if not os.path.exists(save_dir):
       os.makedirs(save_dir)
-   with open(os.path.abspath(args.file), 'r', encoding='utf-8') as fin:
-      source = json.load(fin)
+   if orjson is not None:
+      with open(os.path.abspath(args.file), 'rb') as fin:
+         source = orjson.loads(fin.read())
+   else:
+      with open(os.path.abspath(args.file), 'r', encoding='utf-8') as fin:
+         source = json.load(fin)
 
-
-   with open(os.path.abspath(os.path.join(base, './temp/ros2_graph_template.html')), 'r', encoding='utf-8') as fin:
-      temp = Template(source=fin.read())
-   output_str = temp.render(elements_data=source)
+   # テンプレート側で再シリアライズせず、JSON文字列として埋め込む
+   # ("</script>" などでscriptタグが閉じないよう "<" はエスケープ)
+   if orjson is not None:
+      source_json = orjson.dumps(source).decode()
+   else:
+      source_json = json.dumps(source)
+   source_json = source_json.replace('<', '\\u003c')
+   output_str = _get_template().render(elements_data_json=source_json)
    with open(os.path.join(save_dir, "index.html"), 'w', encoding='utf-8') as fout:
       fout.write(output_str)
 
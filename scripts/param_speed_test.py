@@ -2,9 +2,10 @@
 """
 ROS2 state dumper パラメータ取得方法の速度比較テスト
 
-2つの実装方法を直接実行して比較:
+複数の実装方法を直接実行して比較:
 - Method 1: ros2 param list + ros2 param get (個別取得)
 - Method 2: ros2 param dump (一括取得 + フラット化)
+- Method 3: rclpy の ListParameters + GetParameters サービス (プロセス内で一括取得, rclpy が利用可能な場合のみ)
 """
 
 import json
@@ -16,6 +17,23 @@ import yaml
 import time
 from typing import Dict, List, Any, Set
 
+try:
+    from yaml import CSafeLoader
+
+    def safe_load(stream: str) -> Any:
+        """libyamlのCローダーでYAMLをパース"""
+        return yaml.load(stream, Loader=CSafeLoader)
+except ImportError:
+    safe_load = yaml.safe_load
+
+try:
+    import rclpy
+    from rclpy.node import Node
+    from rcl_interfaces.msg import ParameterType
+    from rcl_interfaces.srv import GetParameters, ListParameters
+except ImportError:
+    rclpy = None
+
 
 IGNORE_SERVICE_NAMES = [
     'describe_parameters',
@@ -35,20 +53,26 @@ IGNORE_NODE_PATTERNS = [
     r'/_ros2cli_.*',
 ]
 
+# IGNORE_NODE_PATTERNSを1つの正規表現にまとめて事前コンパイル (re.matchと同じく先頭一致)
+_SKIP_RE = re.compile("|".join(f"(?:{p})" for p in IGNORE_NODE_PATTERNS))
+
+# サブプロセスに渡す環境変数 (実行中に変化しないため起動時に1回だけコピー)
+_ENV = os.environ.copy()
+
 
 def run_ros2_command(cmd_list: List[str], timeout: int = 10) -> str | None:
     """ROS 2のCLIコマンドを実行"""
     try:
-        env = os.environ.copy()
+        # stderrは使わないので捨て、stdoutだけをバイト列で受け取ってデコード
         result = subprocess.run(
             cmd_list,
             check=True,
-            capture_output=True,
-            text=True,
-            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=_ENV,
             timeout=timeout
         )
-        return result.stdout.strip()
+        return result.stdout.decode('utf-8', 'replace').strip()
     except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
         return None
 
@@ -57,11 +81,16 @@ def run_ros2_command(cmd_list: List[str], timeout: int = 10) -> str | None:
 # Method 1: param list + param get (個別取得)
 # ============================================================================
 
+_PY_VAL_RE = re.compile(r'(String|Integer|Boolean|Double)\s+value\s+is:\s+(.*)', re.DOTALL | re.IGNORECASE)
+_TYPE_RE = re.compile(r'Type:\s+(\w+)', re.IGNORECASE)
+_VALUE_RE = re.compile(r'Value:\s+(.*)', re.DOTALL)
+
+
 def parse_param_get_output(output: str) -> Dict[str, Any]:
     """ros2 param getの出力をパース"""
     param = {"value": None, "type": "unknown"}
     
-    match_python = re.search(r'(String|Integer|Boolean|Double)\s+value\s+is:\s+(.*)', output, re.DOTALL | re.IGNORECASE)
+    match_python = _PY_VAL_RE.search(output) if 'value is:' in output.lower() else None
     if match_python:
         value_type = match_python.group(1).lower()
         value_str = match_python.group(2).strip()
@@ -78,8 +107,18 @@ def parse_param_get_output(output: str) -> Dict[str, Any]:
             param["value"] = value_str
         return param
     
-    type_match = re.search(r'Type:\s+(\w+)', output, re.IGNORECASE)
-    value_match = re.search(r'Value:\s+(.*)', output, re.DOTALL)
+    # "Type: ... Value: ..." 形式は正規表現を使わずpartitionで1パス分割
+    _, type_sep, rest = output.partition('Type:')
+    type_part, value_sep, value_part = rest.partition('Value:')
+    if type_sep and value_sep:
+        type_words = type_part.split()
+        if type_words:
+            param["type"] = type_words[0].lower()
+        param["value"] = value_part.strip()
+        return param
+    
+    type_match = _TYPE_RE.search(output)
+    value_match = _VALUE_RE.search(output)
     
     if type_match:
         param["type"] = type_match.group(1).lower()
@@ -89,10 +128,19 @@ def parse_param_get_output(output: str) -> Dict[str, Any]:
     return param
 
 
-def get_parameters_method1(node_name: str) -> List[Dict[str, Any]]:
-    """Method 1: param list + param getで個別取得"""
+def fetch_param_list(node_name: str, timeout: int = 10) -> str | None:
+    """ros2 param listの生出力を取得 (パラメータサービスが応答しない場合はNone)"""
+    return run_ros2_command(["ros2", "param", "list", node_name, "--include-hidden"], timeout=timeout)
+
+
+def get_parameters_method1(node_name: str, param_list_raw: str | None = None) -> List[Dict[str, Any]]:
+    """
+    Method 1: param list + param getで個別取得
+    param_list_raw に取得済みの param list 出力を渡した場合は、param list の呼び出しを省略する。
+    """
     parameters = []
-    param_list_raw = run_ros2_command(["ros2", "param", "list", node_name, "--include-hidden"])
+    if param_list_raw is None:
+        param_list_raw = fetch_param_list(node_name)
     
     if param_list_raw:
         for param_name_line in param_list_raw.split('\n'):
@@ -119,33 +167,36 @@ def get_parameters_method1(node_name: str) -> List[Dict[str, Any]]:
 # Method 2: param dump (一括取得 + フラット化)
 # ============================================================================
 
+# type()の完全一致で引くため、boolがintとして判定されることもない
+_TYPE_MAP = {
+    bool: "boolean",
+    int: "integer",
+    float: "double",
+    str: "string",
+    list: "array",
+    tuple: "array",
+}
+
+
 def get_python_type_name(value: Any) -> str:
     """Python値から型名を取得"""
-    if isinstance(value, bool):
-        return "boolean"
-    elif isinstance(value, int):
-        return "integer"
-    elif isinstance(value, float):
-        return "double"
-    elif isinstance(value, str):
-        return "string"
-    elif isinstance(value, list):
-        return "array"
-    else:
-        return "unknown"
+    return _TYPE_MAP.get(type(value), "unknown")
 
 
 def flatten_dict(d: Dict[str, Any], parent_key: str = '') -> List[tuple[str, Any]]:
-    """ネストされた辞書をドット記法でフラット化"""
+    """ネストされた辞書をドット記法でフラット化 (再帰せず明示的なスタックで走査し、キー順は保持)"""
     items = []
-    for k, v in d.items():
-        new_key = f"{parent_key}.{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key))
+    stack = [(parent_key, iter(d.items()))]
+    while stack:
+        prefix, it = stack[-1]
+        for k, v in it:
+            new_key = f"{prefix}.{k}" if prefix else k
+            if isinstance(v, dict):
+                stack.append((new_key, iter(v.items())))
+                break
+            items.append((new_key, '' if v is None else v))
         else:
-            if v is None:
-                v = ""
-            items.append((new_key, v))
+            stack.pop()
     return items
 
 
@@ -156,7 +207,7 @@ def get_parameters_method2(node_name: str) -> List[Dict[str, Any]]:
     
     if param_dump_raw:
         try:
-            data = yaml.safe_load(param_dump_raw)
+            data = safe_load(param_dump_raw)
             if data is None:
                 return parameters
             
@@ -181,18 +232,149 @@ def get_parameters_method2(node_name: str) -> List[Dict[str, Any]]:
     return parameters
 
 
+# ============================================================================
+# Method 3: rclpy ListParameters + GetParameters (プロセス内で一括取得)
+# ============================================================================
+
+TEST_NODE_NAME = 'ros2_param_speed_test_node'
+
+# rclpyノード作成後、グラフ情報が揃うまでの待ち時間 [s]
+DISCOVERY_WAIT_SEC = 1.0
+
+if rclpy is not None:
+    # ParameterType -> (ParameterValueのフィールド名, 型名)
+    PARAMETER_VALUE_FIELDS = {
+        ParameterType.PARAMETER_BOOL: ('bool_value', 'boolean'),
+        ParameterType.PARAMETER_INTEGER: ('integer_value', 'integer'),
+        ParameterType.PARAMETER_DOUBLE: ('double_value', 'double'),
+        ParameterType.PARAMETER_STRING: ('string_value', 'string'),
+        ParameterType.PARAMETER_BYTE_ARRAY: ('byte_array_value', 'array'),
+        ParameterType.PARAMETER_BOOL_ARRAY: ('bool_array_value', 'array'),
+        ParameterType.PARAMETER_INTEGER_ARRAY: ('integer_array_value', 'array'),
+        ParameterType.PARAMETER_DOUBLE_ARRAY: ('double_array_value', 'array'),
+        ParameterType.PARAMETER_STRING_ARRAY: ('string_array_value', 'array'),
+    }
+
+
+def call_service(node: "Node", client, request, timeout: float) -> Any:
+    """サービスを呼び出し、応答を待って結果を返す (タイムアウト時はNone)"""
+    if not client.wait_for_service(timeout_sec=timeout):
+        return None
+    future = client.call_async(request)
+    rclpy.spin_until_future_complete(node, future, timeout_sec=timeout)
+    return future.result()
+
+
+def get_parameters_method3(node: "Node", node_name: str, timeout: float = 5.0) -> List[Dict[str, Any]]:
+    """Method 3: ListParameters 1回 + GetParameters 1回でプロセス内から一括取得"""
+    parameters = []
+    list_client = node.create_client(ListParameters, f"{node_name}/list_parameters")
+    get_client = node.create_client(GetParameters, f"{node_name}/get_parameters")
+    try:
+        list_response = call_service(node, list_client, ListParameters.Request(), timeout)
+        if list_response is None:
+            return parameters
+
+        param_names = list(list_response.result.names)
+        if not param_names:
+            return parameters
+
+        get_response = call_service(node, get_client, GetParameters.Request(names=param_names), timeout)
+        if get_response is None:
+            return parameters
+
+        for param_name, param_value in zip(param_names, get_response.values):
+            field_name, param_type = PARAMETER_VALUE_FIELDS.get(param_value.type, (None, "unknown"))
+            if field_name is None:
+                value = None
+            else:
+                value = getattr(param_value, field_name)
+                if param_type == 'array':
+                    value = list(value)
+            parameters.append({
+                "name": param_name,
+                "value": str(value) if value is not None else "None",
+                "type": param_type
+            })
+    finally:
+        node.destroy_client(list_client)
+        node.destroy_client(get_client)
+
+    return parameters
+
+
 def should_skip_node(node_name: str) -> bool:
     """ノードをスキップすべきかチェック"""
-    for pattern in IGNORE_NODE_PATTERNS:
-        if re.match(pattern, node_name):
-            return True
-    return False
+    return bool(_SKIP_RE.match(node_name))
+
+
+def get_node_list_rclpy(node: "Node") -> List[str]:
+    """rclpyのグラフAPIでノードのフルネーム一覧を取得 (ros2 node list -a 相当)"""
+    # 起動直後はDDSのディスカバリが完了していないため少し待つ
+    time.sleep(DISCOVERY_WAIT_SEC)
+    return [
+        f"{namespace.rstrip('/')}/{name}"
+        for name, namespace in node.get_node_names_and_namespaces()
+    ]
+
+
+def check_node_param_service_available_rclpy(node: "Node", node_name: str) -> bool:
+    """rclpyのグラフAPIで /<node>/list_parameters サービスが提供されているかチェック"""
+    namespace, _, name = node_name.rpartition('/')
+    try:
+        services = node.get_service_names_and_types_by_node(name, namespace or '/')
+    except Exception:
+        # NodeNameNonExistentError: 問い合わせ中にノードが消えた場合
+        return False
+    return any(service_name == f"{node_name}/list_parameters" for service_name, _ in services)
 
 
-def check_node_param_service_available(node_name: str) -> bool:
-    """ノードのパラメータサービスが利用可能かチェック"""
-    result = run_ros2_command(["ros2", "param", "list", node_name], timeout=5)
-    return result is not None
+def check_node_reachable(node_name: str, rclpy_node: "Node | None") -> str | None:
+    """
+    ノードのパラメータサービスに到達できるかを確認する (計測は行わない)。
+    スキップする場合は理由の文字列、到達できる場合はNoneを返す。
+    rclpyが無い場合の疎通確認は、Method 1の param list で兼ねる (run_node_benchmark を参照)。
+    """
+    if should_skip_node(node_name):
+        return "pattern matched"
+    if rclpy_node is not None and not check_node_param_service_available_rclpy(rclpy_node, node_name):
+        return "service unavailable"
+    return None
+
+
+def run_node_benchmark(node_name: str, rclpy_node: "Node | None") -> tuple | str:
+    """
+    1ノード分の各Methodを計測する。
+    計測値を比較できるよう、他の計測やサブプロセスと並行させずに呼び出すこと。
+    パラメータサービスが応答しない場合は理由の文字列、それ以外は
+    (time1, params1, time2, params2, time3, params3) を返す。
+    """
+    # Method 1
+    # rclpyが無い場合は param list 自体を疎通確認を兼ねて1回だけ実行し、その結果をMethod 1で使い回す
+    start_time = time.time()
+    if rclpy_node is None:
+        param_list_raw = fetch_param_list(node_name, timeout=5)
+        if param_list_raw is None:
+            return "service unavailable"
+        params1 = get_parameters_method1(node_name, param_list_raw)
+    else:
+        params1 = get_parameters_method1(node_name)
+    time1 = time.time() - start_time
+    
+    # Method 2
+    start_time = time.time()
+    params2 = get_parameters_method2(node_name)
+    time2 = time.time() - start_time
+    
+    # Method 3
+    params3 = None
+    time3 = 0.0
+    if rclpy_node is not None:
+        start_time = time.time()
+        params3 = get_parameters_method3(rclpy_node, node_name)
+        time3 = time.time() - start_time
+    
+    return time1, params1, time2, params2, time3, params3
 
 
 def main():
@@ -202,16 +384,27 @@ def main():
     print("=" * 70, file=sys.stderr)
     print(file=sys.stderr)
     
+    # Method 3 用のノードを1つだけ作成し、全ノードで使い回す
+    rclpy_node = None
+    if rclpy is not None:
+        rclpy.init()
+        rclpy_node = Node(TEST_NODE_NAME)
+    else:
+        print("rclpy not available: Method 3 is skipped", file=sys.stderr)
+    
     # ノードリストを取得
-    node_list_raw = run_ros2_command(["ros2", "node", "list", "-a"])
-    if not node_list_raw:
+    if rclpy_node is not None:
+        node_list_all = get_node_list_rclpy(rclpy_node)
+    else:
+        node_list_raw = run_ros2_command(["ros2", "node", "list", "-a"])
+        node_list_all = [n.strip() for n in (node_list_raw.split('\n') if node_list_raw else []) if n.strip()]
+    if not node_list_all:
         print("Error: No nodes found", file=sys.stderr)
         sys.exit(1)
     
-    node_list_all = [n.strip() for n in node_list_raw.split('\n') if n.strip()]
     node_list_filtered = [
         n for n in node_list_all 
-        if not n.startswith('/_ros2cli_') and n != '/ros2_state_yaml_dumper_node'
+        if not n.startswith('/_ros2cli_') and n not in ('/ros2_state_yaml_dumper_node', f'/{TEST_NODE_NAME}')
     ]
     
     total_nodes = len(node_list_filtered)
@@ -237,32 +430,29 @@ def main():
             "total_parameters": 0,
             "nodes_tested": 0
         },
+        "method3": {
+            "name": "rclpy list + get (in-process batch)",
+            "description": "Uses one rclpy node for ListParameters + a single batched GetParameters call",
+            "total_time": 0,
+            "total_parameters": 0,
+            "nodes_tested": 0
+        },
         "comparison": {}
     }
     
-    # 各ノードでテスト
-    for i, node_name in enumerate(node_list_filtered):
-        progress = (i + 1) / total_nodes * 100
-        print(f"[{i+1}/{total_nodes}] ({progress:.0f}%) Testing: {node_name}", file=sys.stderr)
-        
-        # スキップ判定
-        if should_skip_node(node_name):
-            print(f"  → Skipped (pattern matched)", file=sys.stderr)
-            continue
+    # 各Methodの計測は、CPUやros2 CLIの起動を取り合わないよう1ノードずつ順番に行う
+    for completed, node_name in enumerate(node_list_filtered, start=1):
+        progress = completed / total_nodes * 100
         
-        if not check_node_param_service_available(node_name):
-            print(f"  → Skipped (service unavailable)", file=sys.stderr)
+        lines = [f"[{completed}/{total_nodes}] ({progress:.0f}%) Tested: {node_name}"]
+        # 疎通確認 (パターン判定とrclpyのローカルなグラフ参照) は計測に含めない
+        result = check_node_reachable(node_name, rclpy_node) or run_node_benchmark(node_name, rclpy_node)
+        if isinstance(result, str):
+            lines.append(f"  → Skipped ({result})")
+            print("\n".join(lines), file=sys.stderr)
             continue
         
-        # Method 1
-        start_time = time.time()
-        params1 = get_parameters_method1(node_name)
-        time1 = time.time() - start_time
-        
-        # Method 2
-        start_time = time.time()
-        params2 = get_parameters_method2(node_name)
-        time2 = time.time() - start_time
+        time1, params1, time2, params2, time3, params3 = result
         
         results["method1"]["total_time"] += time1
         results["method1"]["total_parameters"] += len(params1)
@@ -272,11 +462,18 @@ def main():
         results["method2"]["total_parameters"] += len(params2)
         results["method2"]["nodes_tested"] += 1
         
-        print(f"  Method 1: {time1:.3f}s ({len(params1)} params)", file=sys.stderr)
-        print(f"  Method 2: {time2:.3f}s ({len(params2)} params)", file=sys.stderr)
+        lines.append(f"  Method 1: {time1:.3f}s ({len(params1)} params)")
+        lines.append(f"  Method 2: {time2:.3f}s ({len(params2)} params)")
+        
+        if params3 is not None:
+            results["method3"]["total_time"] += time3
+            results["method3"]["total_parameters"] += len(params3)
+            results["method3"]["nodes_tested"] += 1
+            lines.append(f"  Method 3: {time3:.3f}s ({len(params3)} params)")
         
         if len(params1) != len(params2):
-            print(f"  ⚠️  Parameter count mismatch: {len(params1)} vs {len(params2)}", file=sys.stderr)
+            lines.append(f"  ⚠️  Parameter count mismatch: {len(params1)} vs {len(params2)}")
+        print("\n".join(lines), file=sys.stderr)
     
     # 比較結果を計算
     time1_total = results["method1"]["total_time"]
@@ -294,6 +491,14 @@ def main():
             results["comparison"]["time_saved_seconds"] = round(time2_total - time1_total, 3)
             results["comparison"]["time_saved_percent"] = round((time2_total - time1_total) / time2_total * 100, 1)
     
+    time3_total = results["method3"]["total_time"]
+    if time1_total > 0 and time3_total > 0:
+        results["comparison"]["method3_speedup_vs_method1"] = round(time1_total / time3_total, 2)
+    
+    if rclpy_node is not None:
+        rclpy_node.destroy_node()
+        rclpy.shutdown()
+    
     # 結果を出力
     print("\n" + "=" * 70, file=sys.stderr)
     print("RESULTS", file=sys.stderr)
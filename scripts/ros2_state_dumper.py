@@ -1,12 +1,51 @@
+import asyncio
+import functools
+import hashlib
 import json
 import subprocess
 import sys
 import time
 import os
 import re
+import tempfile
 import yaml
+from argparse import ArgumentParser
+from pathlib import Path
 from typing import Dict, List, Any, Set
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from yaml import CSafeLoader
+
+    def safe_load(stream: str) -> Any:
+        """
+        libyamlのCローダーでYAMLをパースする (純Python実装より大幅に速い)。
+        """
+        return yaml.load(stream, Loader=CSafeLoader)
+except ImportError:
+    safe_load = yaml.safe_load
+
+# rosidl_runtime_pyが使える場合は 'ros2 interface show' を起動せず、定義ファイルを直接読む
+try:
+    from rosidl_runtime_py import get_interface_path
+except ImportError:
+    get_interface_path = None
+
+# rclpyが使える場合はros2 CLIを起動せず、プロセス内のノード1つでグラフ情報を取得する
+try:
+    import rclpy
+    from rclpy.node import Node
+    from rclpy.topic_or_service_is_hidden import topic_or_service_is_hidden
+    from composition_interfaces.srv import ListNodes
+    from rcl_interfaces.msg import ParameterType
+    from rcl_interfaces.srv import GetParameters, ListParameters
+except ImportError:
+    rclpy = None
+
 IGNORE_SERVICE_NAMES = [
     'describe_parameters',
     'get_parameter_types',
@@ -26,30 +65,74 @@ IGNORE_NODE_PATTERNS = [
     r'/_ros2cli_.*',  # ROS 2 CLIの一時ノード
 ]
 
+# IGNORE_NODE_PATTERNSを1つの正規表現にまとめたもの (matchは先頭一致のため各パターンのre.matchと同じ判定)
+_IGNORE_NODE_COMBINED = re.compile("|".join(f"(?:{p})" for p in IGNORE_NODE_PATTERNS))
+
+# "ros2 topic list -t" / "ros2 service list -t" の行: "/name [pkg/msg/Type]"
+# (出力全体に対してfinditerするため、各行の先頭にアンカーする)
+_TOPIC_LINE_RE = re.compile(r'^[ \t]*(/[\w/]+)[ \t]+\[([\w/]+)\]', re.MULTILINE)
+# "ros2 component list" のコンポーネント行: "  1  /namespace/node_name (package::ClassName)"
+_COMPONENT_LINE_RE = re.compile(r'^[ \t]+\d+[ \t]+(/[\w/]+)', re.MULTILINE)
+
+# インターフェーススキーマのディスク上のキャッシュ (ユーザーごとのキャッシュディレクトリに置く)
+# ファイルはAMENT_PREFIX_PATHごとに分け、各エントリはスキーマが参照するパッケージの定義ファイルの
+# スタンプで検証する (再ビルドで .msg/.srv が変わればキャッシュは使われない)
+_SCHEMA_CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'ros2_graph_and_state_viewer'
+_SCHEMA_CACHE_PATH = _SCHEMA_CACHE_DIR / (
+    f"schema_cache_{hashlib.md5(os.environ.get('AMENT_PREFIX_PATH', '').encode()).hexdigest()[:12]}.json"
+)
+# 型名 -> {"schema": スキーマ, "packages": {パッケージ名: [shareディレクトリ, スタンプ]}}
+# (load_schema_cache で読み込むまではNoneで、キャッシュは使わない)
+_schema_cache: Dict[str, Dict[str, Any]] | None = None
+# 今回の実行で新しく取得したスキーマがあるか
+_schema_cache_dirty = False
+# スタンプの対象とする、パッケージのshareディレクトリ以下のインターフェース定義のディレクトリ
+INTERFACE_KINDS = ('msg', 'srv', 'action')
+
+# 接続情報: (type, source_id, target_id, direction)
+Connection = tuple[str, str, str, str]
+
+# ros2 CLIのサブプロセスを同時に実行する数の上限 (ノード数ではなくプロセス数で数える)
+# 1プロセスごとにPythonとrclpyの起動でCPUを使うため、CPU数に合わせて絞る
+MAX_CONCURRENT_COMMANDS = min(32, (os.cpu_count() or 4) * 2)
+
+# rclpyでグラフを取得する際のダンパー自身のノード名 (ノード一覧からは除外される)
+DUMPER_NODE_NAME = 'ros2_state_yaml_dumper_node'
+# rclpyノード作成後、DDSのディスカバリでグラフ情報が揃うまでの待ち時間 [s]
+RCLPY_DISCOVERY_WAIT_SEC = 1.0
+# rclpyでのサービス呼び出し (パラメータ取得など) のタイムアウト [s]
+RCLPY_SERVICE_TIMEOUT_SEC = 6.0
+
+
+def report_command_error(cmd_list: List[str], stderr: str) -> None:
+    """
+    ROS 2のCLIコマンドが異常終了した場合のエラーを表示する。
+    """
+    # interface showのパースエラーは簡潔に表示
+    if "interface" in cmd_list and "show" in cmd_list:
+        interface_type = cmd_list[-1] if len(cmd_list) > 0 else "unknown"
+        print(f"Warning: Failed to get schema for {interface_type}", file=sys.stderr)
+    elif "Node not found" not in stderr:
+        print(f"Error running ROS 2 command: {' '.join(cmd_list)}", file=sys.stderr)
+        print(f"Stderr: {stderr}", file=sys.stderr)
+
 
 def run_ros2_command(cmd_list: List[str], timeout: int = 10) -> str | None:
     """
     ROS 2のCLIコマンドを実行し、標準出力を取得するヘルパー関数。
     """
     try:
-        env = os.environ.copy()
+        # envは指定せず、現在の環境変数をそのまま子プロセスに継承させる (呼び出し毎のコピーを避ける)
         result = subprocess.run(
             cmd_list,
             check=True,
             capture_output=True,
             text=True,
-            env=env,
             timeout=timeout
         )
         return result.stdout.strip()
     except subprocess.CalledProcessError as e:
-        # interface showのパースエラーは簡潔に表示
-        if "interface" in cmd_list and "show" in cmd_list:
-            interface_type = cmd_list[-1] if len(cmd_list) > 0 else "unknown"
-            print(f"Warning: Failed to get schema for {interface_type}", file=sys.stderr)
-        elif "Node not found" not in e.stderr:
-            print(f"Error running ROS 2 command: {' '.join(cmd_list)}", file=sys.stderr)
-            print(f"Stderr: {e.stderr}", file=sys.stderr)
+        report_command_error(cmd_list, e.stderr)
         return None
     except FileNotFoundError:
         print(f"ROS 2 command not found. Ensure ROS 2 environment is sourced.", file=sys.stderr)
@@ -58,45 +141,60 @@ def run_ros2_command(cmd_list: List[str], timeout: int = 10) -> str | None:
         print(f"ROS 2 command timed out: {' '.join(cmd_list)}", file=sys.stderr)
         return None
 
-def should_skip_node_param_dump(node_name: str) -> bool:
+
+async def run_ros2_command_async(cmd_list: List[str], semaphore: asyncio.Semaphore, timeout: int = 10) -> str | None:
     """
-    ノード名がparam dumpをスキップすべきパターンに一致するかチェック。
+    run_ros2_command の非同期版。サブプロセスの完了待ちにスレッドを使わず、
+    タイムアウト時は子プロセスをkillしてNoneを返す。
+    同時に起動するサブプロセスの数は、呼び出し元全体で共有する semaphore で制限する
+    (タイムアウトはsemaphoreを獲得してから数える)。
     """
-    for pattern in IGNORE_NODE_PATTERNS:
-        if re.match(pattern, node_name):
-            return True
-    return False
+    async with semaphore:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd_list,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError:
+            print(f"ROS 2 command not found. Ensure ROS 2 environment is sourced.", file=sys.stderr)
+            sys.exit(1)
+
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            print(f"ROS 2 command timed out: {' '.join(cmd_list)}", file=sys.stderr)
+            return None
 
+    if proc.returncode != 0:
+        report_command_error(cmd_list, stderr.decode('utf-8', 'replace'))
+        return None
+    return stdout.decode('utf-8', 'replace').strip()
 
-def check_node_param_service_available(node_name: str) -> bool:
+def should_skip_node_param_dump(node_name: str) -> bool:
     """
-    ノードのパラメータサービスが応答可能かを短いタイムアウトでチェック。
-    param listコマンドを5秒のタイムアウトで実行し、正常に応答するか確認する。
+    ノード名がparam dumpをスキップすべきパターンに一致するかチェック。
     """
-    result = run_ros2_command(["ros2", "param", "list", node_name], timeout=5)
-    if result is None:
-        return False
-    # "Exception while calling service"のようなエラーがstderrに出ている場合もあるが、
-    # run_ros2_commandはstdoutのみを返すので、結果がNoneならエラーと判断
-    return True
+    return _IGNORE_NODE_COMBINED.match(node_name) is not None
+
+
+# type()の完全一致で引くため、boolのサブクラス判定に頼らずintと区別できる
+_TYPE_NAME_MAP = {
+    bool: "boolean",
+    int: "integer",
+    float: "double",
+    str: "string",
+    list: "array",
+}
 
 
 def get_python_type_name(value: Any) -> str:
     """
     Python値から型名を取得する。
     """
-    if isinstance(value, bool):
-        return "boolean"
-    elif isinstance(value, int):
-        return "integer"
-    elif isinstance(value, float):
-        return "double"
-    elif isinstance(value, str):
-        return "string"
-    elif isinstance(value, list):
-        return "array"
-    else:
-        return "unknown"
+    return _TYPE_NAME_MAP.get(type(value), "unknown")
 
 
 def flatten_dict(d: Dict[str, Any], parent_key: str = '') -> List[tuple[str, Any]]:
@@ -104,17 +202,24 @@ def flatten_dict(d: Dict[str, Any], parent_key: str = '') -> List[tuple[str, Any
     ネストされた辞書をドット記法でフラット化する。
     
     例: {'a': {'b': 1, 'c': 2}} -> [('a.b', 1), ('a.c', 2)]
+
+    再帰せず (prefix, itemsのイテレータ) の明示的なスタックで走査するため、
+    深いネストでもRecursionErrorにならず、中間リストも作らない。キーの順序は再帰版と同じ。
     """
     items = []
-    for k, v in d.items():
-        new_key = f"{parent_key}.{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key))
-        else:
+    stack = [(parent_key, iter(d.items()))]
+    while stack:
+        prefix, it = stack[-1]
+        for k, v in it:
+            new_key = f"{prefix}.{k}" if prefix else k
+            if isinstance(v, dict):
+                # 子の辞書を先に走査し、終わったら親の続きから再開する
+                stack.append((new_key, iter(v.items())))
+                break
             # Noneは空文字列に変換
-            if v is None:
-                v = ""
-            items.append((new_key, v))
+            items.append((new_key, "" if v is None else v))
+        else:
+            stack.pop()
     return items
 
 
@@ -122,41 +227,25 @@ def parse_param_dump_output(output: str, node_name: str) -> List[Dict[str, Any]]
     """
     'ros2 param dump' の出力 (YAML形式) をパースし、パラメータリストを返す。
     ネストされた辞書構造はドット記法で展開される。
+    YAMLのパースエラー (yaml.YAMLError) は呼び出し側で処理する。
     """
-    parameters: List[Dict[str, Any]] = []
+    data = safe_load(output)
+    if not isinstance(data, dict):
+        return []
 
-    try:
-        data = yaml.safe_load(output)
-        if data is None:
-            return parameters
+    # ros2 param dump の出力形式: {node_name: {ros__parameters: {param1: value1, ...}}}
+    # ノード名がキーにない場合、直接ros__parametersがある可能性
+    node_params = data.get(node_name, data)
+    ros_params = node_params.get('ros__parameters') if isinstance(node_params, dict) else None
+    if not isinstance(ros_params, dict):
+        return []
 
-        # ros2 param dump の出力形式: {node_name: {ros__parameters: {param1: value1, ...}}}
-        if node_name in data:
-            node_params = data[node_name]
-        else:
-            # ノード名がキーにない場合、直接ros__parametersがある可能性
-            node_params = data
-
-        if isinstance(node_params, dict) and 'ros__parameters' in node_params:
-            ros_params = node_params['ros__parameters']
-            if isinstance(ros_params, dict):
-                # パラメータをフラット化
-                flattened = flatten_dict(ros_params)
-                for param_name, param_value in flattened:
-                    # Noneは空文字列として扱う
-                    if param_value is None:
-                        param_value = ""
-                    param_type = get_python_type_name(param_value)
-                    param_value_str = str(param_value)
-                    parameters.append({
-                        "name": param_name,
-                        "value": param_value_str,
-                        "type": param_type
-                    })
-    except yaml.YAMLError as e:
-        print(f"Error parsing YAML for node {node_name}: {e}", file=sys.stderr)
-
-    return parameters
+    # パラメータをフラット化 (Noneは空文字列として扱う)
+    return [
+        {"name": param_name, "value": "", "type": "string"} if param_value is None else
+        {"name": param_name, "value": str(param_value), "type": get_python_type_name(param_value)}
+        for param_name, param_value in flatten_dict(ros_params)
+    ]
 
 
 def get_component_info() -> tuple[Set[str], Set[str]]:
@@ -166,217 +255,836 @@ def get_component_info() -> tuple[Set[str], Set[str]]:
     Returns:
         tuple[Set[str], Set[str]]: (コンテナ名のセット, コンポーネントノード名のセット)
     """
-    container_nodes: Set[str] = set()
-    component_nodes: Set[str] = set()
-
     # コンポーネントコンテナのリストを取得
-    component_list_raw = run_ros2_command(["ros2", "component", "list"])
+    component_list_raw = run_ros2_command(["ros2", "component", "list"]) or ""
 
-    if component_list_raw:
-        for line in component_list_raw.split('\n'):
-            line = line.rstrip()
-            if not line:
-                continue
+    # コンテナ名の行 (先頭がスペースでない)
+    container_nodes: Set[str] = {
+        stripped for line in component_list_raw.splitlines()
+        if (stripped := line.strip()) and not line.startswith(' ')
+    }
+    # コンポーネントの行 (先頭がスペース) 形式: "  1  /namespace/node_name (package::ClassName)"
+    component_nodes: Set[str] = set(_COMPONENT_LINE_RE.findall(component_list_raw))
 
-            # コンテナ名の行 (先頭がスペースでない)
-            if not line.startswith(' '):
-                container_name = line.strip()
-                container_nodes.add(container_name)
-                continue
+    return container_nodes, component_nodes
 
-            # コンポーネントの行 (先頭がスペース)
-            # 形式: "  1  /namespace/node_name (package::ClassName)"
-            match = re.match(r'\s+\d+\s+(/[\w/]+)', line)
-            if match:
-                node_name = match.group(1)
-                component_nodes.add(node_name)
+# .msg/.srv のフィールド型のうち、ネスト展開しないプリミティブ型
+PRIMITIVE_FIELD_TYPES = {
+    'bool', 'byte', 'char',
+    'float32', 'float64',
+    'int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'int64', 'uint64',
+    'string', 'wstring',
+    # ROS 1 由来の型名
+    'time', 'duration',
+}
 
-    return container_nodes, component_nodes
+# フィールド型からベース型を取り出す: "geometry_msgs/Point[<=10]" -> "geometry_msgs/Point", "string<=5" -> "string"
+_FIELD_BASE_TYPE_RE = re.compile(r'[^\[<]+')
 
-def parse_interface_schema(interface_type: str) -> List[str]:
+
+def strip_definition_lines(text: str) -> List[str]:
+    """
+    インターフェース定義のテキストから、空行と#コメント、//コメントの行を除いた行を返す。
     """
-    'ros2 interface show' コマンドを実行し、出力を行ごとにパースしてリストで返す。
+    return [
+        line for line in map(str.rstrip, text.splitlines())
+        if (trimmed_line_start := line.lstrip()) and not trimmed_line_start.startswith(('#', '//'))
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def read_interface_definition(interface_type: str) -> tuple[str, ...]:
     """
-    output = run_ros2_command(["ros2", "interface", "show", interface_type])
+    'pkg/msg/Type' 形式のインターフェース定義ファイル (.msg/.srv/.action) を読み、
+    空行とコメント行を除いた行を返す。同じ型は複数回読まないようキャッシュする。
+    """
+    kind = interface_type.split('/')[1]
+    with open(get_interface_path(f"{interface_type}.{kind}"), 'r', encoding='utf-8') as fin:
+        return tuple(strip_definition_lines(fin.read()))
+
+
+def get_nested_message_type(field_line: str, package_name: str) -> str | None:
+    """
+    フィールド定義行がメッセージ型のフィールドなら 'pkg/msg/Type' を返す (プリミティブ・定数・区切りはNone)。
+
+    >>> get_nested_message_type('geometry_msgs/Point[<=10] points', 'nav_msgs')
+    'geometry_msgs/msg/Point'
+    >>> get_nested_message_type('Point[<=3] p', 'geometry_msgs')
+    'geometry_msgs/msg/Point'
+    >>> get_nested_message_type('int32 FOO=1', 'std_msgs') is None
+    True
+    """
+    field, _, _ = field_line.partition('#')
+    tokens = field.split()
+    # 定数の '=' は型の後ろにだけ現れる (型の "[<=N]" や "<=N" の '=' は上限付き配列・文字列)
+    if len(tokens) < 2 or '=' in ''.join(tokens[1:]):
+        return None
+    match = _FIELD_BASE_TYPE_RE.match(tokens[0])
+    base_type = match.group(0) if match else tokens[0]
+    if base_type in PRIMITIVE_FIELD_TYPES:
+        return None
+    if '/' in base_type:
+        pkg, _, name = base_type.rpartition('/')
+        pkg = pkg.split('/')[0]
+    elif base_type == 'Header':
+        pkg, name = 'std_msgs', 'Header'
+    else:
+        pkg, name = package_name, base_type
+    return f"{pkg}/msg/{name}"
+
+
+def expand_interface_definition(interface_type: str, depth: int = 0) -> List[str]:
+    """
+    定義ファイルの各行を出力し、メッセージ型のフィールドはその定義をタブでインデントして展開する
+    ('ros2 interface show' と同じ形式)。
+    """
+    package_name = interface_type.split('/')[0]
     schema: List[str] = []
+    for line in read_interface_definition(interface_type):
+        schema.append('\t' * depth + line)
+        nested_type = get_nested_message_type(line, package_name)
+        if nested_type is not None:
+            schema.extend(expand_interface_definition(nested_type, depth + 1))
+    return schema
 
-    if output:
-        for line in output.split('\n'):
-            line = line.rstrip()
-            trimmed_line_start = line.lstrip()
 
-            # 空行、#コメント、//コメントをスキップ
-            if not trimmed_line_start or trimmed_line_start.startswith('#') or trimmed_line_start.startswith('//'):
-                continue
+async def parse_interface_schema(interface_type: str, semaphore: asyncio.Semaphore) -> List[str]:
+    """
+    インターフェースのスキーマを行ごとのリストで返す。
+    rosidl_runtime_pyが使える場合は定義ファイルを直接 (ファイル読み込みはスレッドで) 読み、
+    使えない・見つからない場合は 'ros2 interface show' コマンドを実行して、出力を行ごとにパースする。
+    """
+    if get_interface_path is not None:
+        try:
+            return await asyncio.to_thread(expand_interface_definition, interface_type)
+        except (LookupError, ValueError, IndexError, OSError):
+            pass
+
+    output = await run_ros2_command_async(["ros2", "interface", "show", interface_type], semaphore)
+    return strip_definition_lines(output) if output else []
+
+
+def find_package_share_directory(package_name: str) -> str | None:
+    """
+    AMENT_PREFIX_PATHの先頭から順にament indexを調べ、パッケージのshareディレクトリを返す (見つからなければNone)。
+    """
+    for prefix in os.environ.get('AMENT_PREFIX_PATH', '').split(os.pathsep):
+        if prefix and os.path.exists(os.path.join(prefix, 'share', 'ament_index', 'resource_index', 'packages', package_name)):
+            return os.path.join(prefix, 'share', package_name)
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_package_stamp(package_name: str) -> tuple[str, str] | None:
+    """
+    パッケージのインターフェース定義ファイル (名前・mtime・サイズ) から求めたスタンプを
+    (shareディレクトリ, スタンプ) で返す。パッケージが見つからなければNone。
+    """
+    share_dir = find_package_share_directory(package_name)
+    if share_dir is None:
+        return None
+    entries = []
+    for kind in INTERFACE_KINDS:
+        try:
+            with os.scandir(os.path.join(share_dir, kind)) as it:
+                for entry in it:
+                    stat = entry.stat()
+                    entries.append(f"{kind}/{entry.name}:{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            continue
+    entries.sort()
+    return share_dir, hashlib.md5("\n".join(entries).encode()).hexdigest()
+
+
+def get_schema_packages(interface_type: str, schema: List[str]) -> Set[str]:
+    """
+    スキーマが参照するパッケージ名のセットを返す (インターフェース自身のパッケージとネストされた型のパッケージ)。
+
+    >>> sorted(get_schema_packages('nav_msgs/msg/Foo', ['foo_msgs/Bar[<=4] b', '\tint32 x']))
+    ['foo_msgs', 'nav_msgs']
+    """
+    package_name = interface_type.split('/')[0]
+    packages = {package_name}
+    for line in schema:
+        nested_type = get_nested_message_type(line.lstrip('\t'), package_name)
+        if nested_type is not None:
+            packages.add(nested_type.split('/')[0])
+    return packages
+
+
+def get_schema_package_stamps(interface_type: str, schema: List[str]) -> Dict[str, List[str]] | None:
+    """
+    スキーマが参照する全パッケージのスタンプを返す。見つからないパッケージがあればNone (キャッシュしない)。
+    """
+    stamps: Dict[str, List[str]] = {}
+    for package_name in get_schema_packages(interface_type, schema):
+        stamp = get_package_stamp(package_name)
+        if stamp is None:
+            return None
+        stamps[package_name] = list(stamp)
+    return stamps
+
+
+def is_schema_cache_entry_fresh(entry: Dict[str, Any]) -> bool:
+    """
+    キャッシュのエントリが参照するパッケージの定義ファイルが、保存時から変わっていないかを返す。
+    """
+    return all(
+        (stamp := get_package_stamp(package_name)) is not None and list(stamp) == saved_stamp
+        for package_name, saved_stamp in entry["packages"].items()
+    )
+
+
+def is_valid_schema_cache_entry(entry: Any) -> bool:
+    """
+    キャッシュファイルから読んだエントリが期待する形式かを返す (壊れた・不正なエントリは使わない)。
+    """
+    if not isinstance(entry, dict):
+        return False
+    schema = entry.get("schema")
+    packages = entry.get("packages")
+    return (
+        isinstance(schema, list) and all(isinstance(line, str) for line in schema)
+        and isinstance(packages, dict) and bool(packages)
+        and all(
+            isinstance(stamp, list) and len(stamp) == 2 and all(isinstance(v, str) for v in stamp)
+            for stamp in packages.values()
+        )
+    )
+
+
+def prepare_schema_cache_dir() -> bool:
+    """
+    キャッシュディレクトリを自分だけが読み書きできる権限 (0700) で作成する。
+    他のユーザーが書き込めるディレクトリの場合はキャッシュを使わない。
+    """
+    try:
+        _SCHEMA_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        stat = _SCHEMA_CACHE_DIR.stat()
+    except OSError as e:
+        print(f"Warning: Schema cache directory {_SCHEMA_CACHE_DIR} is not available: {e}", file=sys.stderr)
+        return False
+    # (所有者・パーミッションの確認はPOSIXのみ)
+    if hasattr(os, 'getuid') and (stat.st_uid != os.getuid() or stat.st_mode & 0o022):
+        print(f"Warning: Schema cache directory {_SCHEMA_CACHE_DIR} is writable by other users; schema cache disabled", file=sys.stderr)
+        return False
+    return True
+
+
+def load_schema_cache() -> None:
+    """
+    前回の実行で保存したスキーマのキャッシュを読み込み、キャッシュを有効にする。
+    ファイルが無い・読めない場合は空のキャッシュで続行し、形式が不正なエントリは捨てる。
+    """
+    global _schema_cache
+    if not prepare_schema_cache_dir():
+        return
+    _schema_cache = {}
+    try:
+        with open(_SCHEMA_CACHE_PATH, "rb") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return
+    if isinstance(cache, dict):
+        _schema_cache.update(
+            (interface_type, entry) for interface_type, entry in cache.items()
+            if isinstance(interface_type, str) and is_valid_schema_cache_entry(entry)
+        )
 
-            schema.append(line)
 
+def save_schema_cache() -> None:
+    """
+    今回取得したスキーマがあれば、キャッシュファイルへ書き戻す。
+    """
+    if _schema_cache is None or not _schema_cache_dirty:
+        return
+    # 途中で中断されても壊れたファイルが残らないよう、同じディレクトリの一時ファイルに書いてから置き換える
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile("w", dir=_SCHEMA_CACHE_DIR, prefix=".schema_cache_", suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            json.dump(_schema_cache, f)
+        os.replace(tmp_path, _SCHEMA_CACHE_PATH)
+    except OSError as e:
+        print(f"Warning: Failed to save schema cache to {_SCHEMA_CACHE_PATH}: {e}", file=sys.stderr)
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+async def get_interface_schema(interface_type: str, semaphore: asyncio.Semaphore) -> List[str]:
+    """
+    parse_interface_schema の結果をキャッシュ付きで返す (load_schema_cache していなければキャッシュしない)。
+    取得に失敗した場合と区別できないため、空のスキーマはキャッシュしない。
+    """
+    global _schema_cache_dirty
+    if _schema_cache is None:
+        return await parse_interface_schema(interface_type, semaphore)
+
+    entry = _schema_cache.get(interface_type)
+    if entry is not None and await asyncio.to_thread(is_schema_cache_entry_fresh, entry):
+        return entry["schema"]
+
+    schema = await parse_interface_schema(interface_type, semaphore)
+    if schema:
+        packages = await asyncio.to_thread(get_schema_package_stamps, interface_type, schema)
+        if packages is not None:
+            _schema_cache[interface_type] = {"schema": schema, "packages": packages}
+            _schema_cache_dirty = True
     return schema
 
 
-def collect_ros2_graph_data() -> Dict[str, Any]:
+def get_param_skip_nodes(node_list: List[str], container_nodes: Set[str], verbose: bool = False) -> Set[str]:
     """
-    ROS 2のノード、トピック、サービス情報をCLI経由で収集し、JSON構造を構築する。
+    パラメータ取得をスキップするノード名のセットを事前に求める。
+    コンテナノードや特定パターンのノードはparam dumpでタイムアウトするためスキップする。
+    verboseの場合はスキップするノードを1つずつ表示し、そうでなければ件数のみ表示する。
     """
+    skip_nodes: Set[str] = set()
+    for node_name in node_list:
+        if node_name in container_nodes:
+            if verbose:
+                print(f"  Skipping param dump for container node: {node_name}", file=sys.stderr)
+            skip_nodes.add(node_name)
+        elif should_skip_node_param_dump(node_name):
+            if verbose:
+                print(f"  Skipping param dump for pattern-matched node: {node_name}", file=sys.stderr)
+            skip_nodes.add(node_name)
+    if skip_nodes and not verbose:
+        print(f"Skipping param dump for {len(skip_nodes)} nodes (use --verbose to list them)", file=sys.stderr)
+    return skip_nodes
 
-    # 時間計測の開始
-    start_time = time.time()
 
-    graph_data: Dict[str, Any] = {
-        "graph_metadata": {
-            "created_at": int(time.time() * 1000),
-            "description": "Captured ROS 2 network graph using subprocess"
-        },
-        "nodes": {},
-        "topics": {},
-        "services": {},
-        "actions": {},
-        "connections": []
+def build_node_dict(node_name: str, i: int, parameters: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    JSON出力用のノード情報を構築する。
+    """
+    return {
+        "id": f"node_{i}",
+        "name": node_name,
+        "path": [p for p in node_name.split('/') if p],
+        "type": "component",
+        "parameters": parameters
     }
 
-    node_name_to_id: Dict[str, str] = {}
 
-    # 1. ノードリストの取得と総数カウント
+def get_node_list() -> List[str]:
+    """
+    'ros2 node list -a' を実行し、ノード名のリストを返す。
+    """
     node_list_raw = run_ros2_command(["ros2", "node", "list", "-a"])
-    node_list_all = [n.strip() for n in (node_list_raw.split('\n') if node_list_raw else []) if n.strip()]
+    return [stripped for n in (node_list_raw.splitlines() if node_list_raw else []) if (stripped := n.strip())]
+
+
+def parse_name_type_list(list_raw: str, ignore_names: List[str]) -> Dict[str, str]:
+    """
+    'ros2 topic list -t' / 'ros2 service list -t' の出力をパースし、名前 -> 型 の辞書を返す。
+    名前の末尾の要素が ignore_names に含まれるものは除外する。
+    """
+    return {
+        name: type_name
+        for name, type_name in _TOPIC_LINE_RE.findall(list_raw)
+        if name.rpartition('/')[2] not in ignore_names
+    }
 
-    node_list_filtered = []
-    for n in node_list_all:
-        if not n.startswith('/_ros2cli_') and n != '/ros2_state_yaml_dumper_node':
-            node_list_filtered.append(n)
 
-    total_nodes = len(node_list_filtered)
+def get_topics_and_services() -> tuple[Dict[str, str], Dict[str, str]]:
+    """
+    'ros2 topic list -t' / 'ros2 service list -t' を実行し、名前 -> 型 の辞書を返す。
 
-    # 2. トピックとサービスのリストを事前に取得 (接続情報構築のため)
+    Returns:
+        tuple[Dict[str, str], Dict[str, str]]: (トピックの辞書, サービスの辞書)
+    """
     topic_list_raw = run_ros2_command(["ros2", "topic", "list", "-t"])
     service_list_raw = run_ros2_command(["ros2", "service", "list", "-t"])
 
-    discovered_topics: Dict[str, str] = {} # name -> type
-    discovered_services: Dict[str, str] = {} # name -> type
-
-    if topic_list_raw:
-        for line in topic_list_raw.split('\n'):
-            match = re.match(r'(/[\w/]+)\s+\[([\w/]+)\]', line.strip())
-            if match:
-                name = match.group(1)
-                last_topic_name = name.split('/')[-1]
-                if not last_topic_name in IGNORE_TOPIC_NAMES:
-                    type_name = match.group(2)
-                    discovered_topics[name] = type_name
-
-    if service_list_raw:
-        for line in service_list_raw.split('\n'):
-            match = re.match(r'(/[\w/]+)\s+\[([\w/]+)\]', line.strip())
-            if match:
-                name = match.group(1)
-                last_service_name = name.split('/')[-1]
-                if not last_service_name in IGNORE_SERVICE_NAMES:
-                    type_name = match.group(2)
-                    discovered_services[name] = type_name
-
-    # 3. コンポーネント情報の取得 (コンテナはparam dumpでタイムアウトするためスキップ)
-    print("Getting component info...", file=sys.stderr)
-    container_nodes, component_nodes = get_component_info()
-    print(f"Found {len(container_nodes)} container nodes, {len(component_nodes)} component nodes", file=sys.stderr)
-
-    # 4. ノードごとの情報と接続の収集
-    for i, node_name in enumerate(node_list_filtered):
-        # 進捗情報の出力
-        processed_nodes = i + 1
-        progress = (processed_nodes / total_nodes) * 100
-        print(f"Processing node {processed_nodes}/{total_nodes} ({progress:.0f}%): {node_name}", file=sys.stderr)
-
-        node_id = f"node_{i}"
-        node_name_to_id[node_name] = node_id
-
-        # パス構築
-        path_parts = [p for p in node_name.split('/') if p]
+    discovered_topics = parse_name_type_list(topic_list_raw, IGNORE_TOPIC_NAMES) if topic_list_raw else {}
+    discovered_services = parse_name_type_list(service_list_raw, IGNORE_SERVICE_NAMES) if service_list_raw else {}
 
+    return discovered_topics, discovered_services
+
+
+def parse_node_info_output(
+    node_info_raw: str,
+    node_name: str,
+    discovered_topics: Dict[str, str],
+    discovered_services: Dict[str, str],
+) -> List[Connection]:
+    """
+    'ros2 node info' の出力をパースし、接続情報のタプルのリストを返す。
+    """
+    # 接続情報の収集 (dictではなく (type, source_id, target_id, direction) のタプルで保持)
+    connections: List[Connection] = []
+    connections_append = connections.append
+    current_section = None
+    for line in node_info_raw.splitlines():
+        stripped = line.strip()
+        if stripped.endswith(':'):
+            current_section = stripped[:-1]
+            continue
+        if not current_section or not stripped:
+            continue
+
+        name, _, _ = stripped.partition(':') # トピック/サービス名
+        name = name.strip()
+
+        if current_section == 'Publishers' and name in discovered_topics:
+            connections_append(("topic", node_name, name, "publish"))
+        elif current_section == 'Subscribers' and name in discovered_topics:
+            connections_append(("topic", name, node_name, "subscribe"))
+        elif current_section == 'Service Servers' and name in discovered_services:
+            connections_append(("service", name, node_name, "provide"))
+        elif current_section == 'Service Clients' and name in discovered_services:
+            connections_append(("service", node_name, name, "call"))
+
+    return connections
+
+
+async def collect_one_node(
+    node_name: str,
+    i: int,
+    skip_nodes: Set[str],
+    discovered_topics: Dict[str, str],
+    discovered_services: Dict[str, str],
+    semaphore: asyncio.Semaphore,
+) -> tuple[Dict[str, Any], List[Connection]]:
+    """
+    1ノード分のパラメータと接続情報を収集する。
+    param dump と node info は並行して実行するが、サブプロセスの同時実行数は semaphore で全体として制限される。
+
+    Returns:
+        tuple[Dict[str, Any], List[Connection]]: (ノード情報, 接続情報のタプルのリスト)
+    """
+    async def dump_parameters() -> List[Dict[str, Any]]:
         # パラメータの取得 (ros2 param dump を使用)
-        # コンテナノードや特定パターンのノードはparam dumpでタイムアウトするためスキップ
-        parameters: List[Dict[str, Any]] = []
-        if node_name in container_nodes:
-            print(f"  Skipping param dump for container node: {node_name}", file=sys.stderr)
-        elif should_skip_node_param_dump(node_name):
-            print(f"  Skipping param dump for pattern-matched node: {node_name}", file=sys.stderr)
-        elif not check_node_param_service_available(node_name):
-            print(f"  Skipping param dump for node with unavailable param service: {node_name}", file=sys.stderr)
-        else:
-            param_dump_raw = run_ros2_command(["ros2", "param", "dump", node_name, "--include-hidden-nodes"])
-
-            if param_dump_raw:
-                parameters = parse_param_dump_output(param_dump_raw, node_name)
-
-        # ノード情報の構築
-        graph_data["nodes"][node_name] = {
-            "id": node_id,
-            "name": node_name,
-            "path": path_parts,
-            "type": "component",
-            "parameters": parameters
-        }
+        if node_name in skip_nodes:
+            return []
+        # param listによる事前の疎通確認は行わず、短めのタイムアウトで直接param dumpする
+        # (応答しないノードはNoneが返り、パラメータは空のまま)
+        param_dump_raw = await run_ros2_command_async(["ros2", "param", "dump", node_name, "--include-hidden-nodes"], semaphore, timeout=6)
+        if not param_dump_raw:
+            return []
+        try:
+            return parse_param_dump_output(param_dump_raw, node_name)
+        except yaml.YAMLError as e:
+            print(f"Error parsing YAML for node {node_name}: {e}", file=sys.stderr)
+            return []
+
+    parameters, node_info_raw = await asyncio.gather(
+        dump_parameters(),
+        run_ros2_command_async(["ros2", "node", "info", node_name], semaphore),
+    )
+
+    node_dict = build_node_dict(node_name, i, parameters)
+    connections = parse_node_info_output(node_info_raw, node_name, discovered_topics, discovered_services) if node_info_raw else []
+    return node_dict, connections
+
+
+async def collect_nodes_and_schemas(
+    rclpy_node: "Node | None",
+    node_list: List[str],
+    skip_nodes: Set[str],
+    discovered_topics: Dict[str, str],
+    discovered_services: Dict[str, str],
+) -> tuple[List[tuple[Dict[str, Any], List[Connection]]], Dict[str, List[str]]]:
+    """
+    全ノードの情報とメッセージスキーマを並行して収集する。
+    ros2 CLIはasyncioのサブプロセスとして起動し、ノードの収集とスキーマ取得で共有する1つのsemaphoreで
+    同時実行数を MAX_CONCURRENT_COMMANDS に絞る。ファイル読み込みやrclpyなどブロッキングする処理はスレッドへ逃がす。
+
+    Returns:
+        tuple[List[tuple[Dict[str, Any], List[Connection]]], Dict[str, List[str]]]:
+            (ノード順の collect_one_node の結果, 型名 -> スキーマ)
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_COMMANDS)
+
+    # 同じ型を共有するトピック/サービスは多いため、スキーマは型ごとに1回だけ取得する
+    unique_types = list(set(discovered_topics.values()) | set(discovered_services.values()))
+    schema_task = asyncio.gather(*(get_interface_schema(type_name, semaphore) for type_name in unique_types))
+
+    if rclpy_node is not None:
+        # グラフ問い合わせはローカルキャッシュ参照、パラメータ取得は一括非同期呼び出しのため並列化不要
+        node_results = await asyncio.to_thread(
+            collect_nodes_rclpy, rclpy_node, node_list, skip_nodes, discovered_topics, discovered_services)
+    else:
+        async def collect_with_index(i: int, node_name: str):
+            return i, await collect_one_node(node_name, i, skip_nodes, discovered_topics, discovered_services, semaphore)
+
+        # 進捗は完了順に出力し、結果は元のノード順で格納する
+        # (ノード数が多いと出力自体が律速になるため、進捗の%表示が変わったときだけ出力する)
+        total_nodes = len(node_list)
+        node_results: List[tuple[Dict[str, Any], List[Connection]] | None] = [None] * total_nodes
+        tasks = [collect_with_index(i, node_name) for i, node_name in enumerate(node_list)]
+        progress_write = sys.stderr.write
+        progress_total = f"/{total_nodes} ("
+        last_progress = -1
+        for processed_nodes, task in enumerate(asyncio.as_completed(tasks), start=1):
+            i, result = await task
+            node_results[i] = result
+            progress = round(processed_nodes * 100 / total_nodes)
+            if progress != last_progress:
+                last_progress = progress
+                progress_write(f"Processed node {processed_nodes}{progress_total}{progress}%): {node_list[i]}\n")
+        sys.stderr.flush()
+
+    schemas = await schema_task
+    return node_results, dict(zip(unique_types, schemas))
+
+
+# ============================================================================
+# rclpy によるプロセス内でのグラフ取得 (ros2 CLIのサブプロセス起動を避ける)
+# ============================================================================
+
+if rclpy is not None:
+    # ParameterType -> ParameterValueのフィールド名
+    PARAMETER_VALUE_FIELDS = {
+        ParameterType.PARAMETER_BOOL: 'bool_value',
+        ParameterType.PARAMETER_INTEGER: 'integer_value',
+        ParameterType.PARAMETER_DOUBLE: 'double_value',
+        ParameterType.PARAMETER_STRING: 'string_value',
+        ParameterType.PARAMETER_BYTE_ARRAY: 'byte_array_value',
+        ParameterType.PARAMETER_BOOL_ARRAY: 'bool_array_value',
+        ParameterType.PARAMETER_INTEGER_ARRAY: 'integer_array_value',
+        ParameterType.PARAMETER_DOUBLE_ARRAY: 'double_array_value',
+        ParameterType.PARAMETER_STRING_ARRAY: 'string_array_value',
+    }
+
+
+def spin_until(node: "Node", predicate, timeout: float) -> bool:
+    """
+    predicateがTrueになるかタイムアウトするまでノードをspinする。
+    """
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        rclpy.spin_once(node, timeout_sec=min(remaining, 0.05))
+    return True
 
-        # 接続情報の収集
-        node_info_raw = run_ros2_command(["ros2", "node", "info", node_name])
-        if node_info_raw:
-            current_section = None
-            for line in node_info_raw.split('\n'):
-                line = line.strip()
-                if line.endswith(':'):
-                    current_section = line[:-1]
-                    continue
-                if not current_section or not line:
-                    continue
-
-                name = line.split(':')[0].strip() # トピック/サービス名
-
-                if current_section == 'Publishers' and name in discovered_topics:
-                    graph_data["connections"].append({
-                        "type": "topic",
-                        "source_id": node_name,
-                        "target_id": name,
-                        "direction": "publish"
-                    })
-                elif current_section == 'Subscribers' and name in discovered_topics:
-                    graph_data["connections"].append({
-                        "type": "topic",
-                        "source_id": name,
-                        "target_id": node_name,
-                        "direction": "subscribe"
-                    })
-                elif current_section == 'Service Servers' and name in discovered_services:
-                    graph_data["connections"].append({
-                        "type": "service",
-                        "source_id": name,
-                        "target_id": node_name,
-                        "direction": "provide"
-                    })
-                elif current_section == 'Service Clients' and name in discovered_services:
-                    graph_data["connections"].append({
-                        "type": "service",
-                        "source_id": node_name,
-                        "target_id": name,
-                        "direction": "call"
-                    })
-
-    # 5. トピック情報の構築 (メッセージスキーマの取得)
-    for name, type_name in discovered_topics.items():
-        graph_data["topics"][name] = {
-            "id": name,
-            "name": name,
-            "type": type_name,
-            "message_schema": parse_interface_schema(type_name)
+
+def call_services_batch(node: "Node", srv_type, requests: Dict[str, tuple[str, Any]], timeout: float) -> Dict[str, Any]:
+    """
+    同じ型のサービスをまとめて非同期に呼び出し、応答が得られたものだけを返す。
+    1ノードずつ待たずに全リクエストを先に送るため、待ち時間は最も遅い応答1回分で済む。
+
+    Args:
+        requests: キー -> (サービス名, リクエスト)
+    Returns:
+        Dict[str, Any]: キー -> レスポンス (タイムアウトしたものは含まない)
+    """
+    clients = {key: node.create_client(srv_type, service_name) for key, (service_name, _) in requests.items()}
+    try:
+        spin_until(node, lambda: all(c.service_is_ready() for c in clients.values()), timeout)
+        futures = {
+            key: client.call_async(requests[key][1])
+            for key, client in clients.items() if client.service_is_ready()
         }
+        spin_until(node, lambda: all(f.done() for f in futures.values()), timeout)
+
+        responses: Dict[str, Any] = {}
+        for key in requests:
+            future = futures.get(key)
+            if future is None or not future.done() or future.result() is None:
+                print(f"ROS 2 service call timed out: {requests[key][0]}", file=sys.stderr)
+                continue
+            responses[key] = future.result()
+        return responses
+    finally:
+        for client in clients.values():
+            node.destroy_client(client)
+
+
+def split_node_name(node_name: str) -> tuple[str, str]:
+    """
+    '/ns/node' 形式のノード名を (node, ns) に分割する。
+    """
+    namespace, _, name = node_name.rpartition('/')
+    return name, namespace or '/'
+
+
+def get_node_list_rclpy(node: "Node") -> List[str]:
+    """
+    rclpyのグラフAPIでノード名の一覧を取得する ('ros2 node list -a' 相当)。
+    """
+    return [
+        f"{namespace.rstrip('/')}/{name}"
+        for name, namespace in node.get_node_names_and_namespaces()
+    ]
+
+
+def get_topics_and_services_rclpy(node: "Node") -> tuple[Dict[str, str], Dict[str, str]]:
+    """
+    rclpyのグラフAPIでトピック/サービスの 名前 -> 型 の辞書を取得する ('ros2 topic/service list -t' 相当)。
+    """
+    discovered_topics: Dict[str, str] = {
+        name: types[0]
+        for name, types in node.get_topic_names_and_types()
+        if types and not topic_or_service_is_hidden(name) and name.split('/')[-1] not in IGNORE_TOPIC_NAMES
+    }
+    discovered_services: Dict[str, str] = {
+        name: types[0]
+        for name, types in node.get_service_names_and_types()
+        if types and not topic_or_service_is_hidden(name) and name.split('/')[-1] not in IGNORE_SERVICE_NAMES
+    }
+    return discovered_topics, discovered_services
+
+
+def get_service_names_of_node_rclpy(node: "Node", node_name: str) -> Set[str]:
+    """
+    ノードが提供するサービス名のセットを返す (ノードが既に存在しない場合は空)。
+    """
+    try:
+        return {name for name, _ in node.get_service_names_and_types_by_node(*split_node_name(node_name))}
+    except Exception:
+        # NodeNameNonExistentError: 問い合わせ中にノードが終了した場合
+        return set()
+
+
+def get_component_info_rclpy(node: "Node", node_list: List[str]) -> tuple[Set[str], Set[str]]:
+    """
+    '_container/list_nodes' サービスを持つノードをコンテナとみなし、
+    ListNodesをまとめて呼び出してコンポーネントノード名を取得する ('ros2 component list' 相当)。
 
-    # 6. サービス情報の構築 (メッセージスキーマの取得)
-    for name, type_name in discovered_services.items():
-        graph_data["services"][name] = {
-            "id": name,
-            "name": name,
-            "type": type_name,
-            "message_schema": parse_interface_schema(type_name)
+    Returns:
+        tuple[Set[str], Set[str]]: (コンテナ名のセット, コンポーネントノード名のセット)
+    """
+    container_nodes: Set[str] = {
+        node_name for node_name in node_list
+        if f"{node_name}/_container/list_nodes" in get_service_names_of_node_rclpy(node, node_name)
+    }
+    responses = call_services_batch(
+        node,
+        ListNodes,
+        {name: (f"{name}/_container/list_nodes", ListNodes.Request()) for name in container_nodes},
+        RCLPY_SERVICE_TIMEOUT_SEC,
+    )
+    component_nodes: Set[str] = {
+        component_name
+        for response in responses.values()
+        for component_name in response.full_node_names
+    }
+    return container_nodes, component_nodes
+
+
+def parameter_value_to_python(value) -> Any:
+    """
+    rcl_interfaces/msg/ParameterValue をPythonの値に変換する (未設定はNone)。
+    """
+    field_name = PARAMETER_VALUE_FIELDS.get(value.type)
+    if field_name is None:
+        return None
+    python_value = getattr(value, field_name)
+    if value.type in (ParameterType.PARAMETER_BOOL, ParameterType.PARAMETER_INTEGER,
+                      ParameterType.PARAMETER_DOUBLE, ParameterType.PARAMETER_STRING):
+        return python_value
+    return list(python_value)
+
+
+def get_parameters_rclpy(node: "Node", node_names: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    全ノードへ ListParameters を一括送信し、続けて GetParameters を1ノード1リクエストで一括送信して
+    パラメータを取得する。出力形式は parse_param_dump_output と揃える。
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: ノード名 -> パラメータのリスト (応答が無かったノードは含まない)
+    """
+    list_responses = call_services_batch(
+        node,
+        ListParameters,
+        {name: (f"{name}/list_parameters", ListParameters.Request()) for name in node_names},
+        RCLPY_SERVICE_TIMEOUT_SEC,
+    )
+    # param dumpの出力 (キーでソートされたネスト辞書) と同じ順序に並べる
+    param_names_by_node = {
+        name: sorted(response.result.names, key=lambda n: n.split('.'))
+        for name, response in list_responses.items()
+    }
+    get_responses = call_services_batch(
+        node,
+        GetParameters,
+        {
+            name: (f"{name}/get_parameters", GetParameters.Request(names=param_names))
+            for name, param_names in param_names_by_node.items() if param_names
+        },
+        RCLPY_SERVICE_TIMEOUT_SEC,
+    )
+
+    parameters_by_node: Dict[str, List[Dict[str, Any]]] = {}
+    for name, param_names in param_names_by_node.items():
+        if not param_names:
+            parameters_by_node[name] = []
+            continue
+        response = get_responses.get(name)
+        if response is None:
+            continue
+        parameters: List[Dict[str, Any]] = []
+        for param_name, param_value in zip(param_names, response.values):
+            value = parameter_value_to_python(param_value)
+            # Noneは空文字列として扱う (param dump経由と同じ)
+            if value is None:
+                value = ""
+            parameters.append({
+                "name": param_name,
+                "value": str(value),
+                "type": get_python_type_name(value)
+            })
+        parameters_by_node[name] = parameters
+    return parameters_by_node
+
+
+def get_node_connections_rclpy(
+    node: "Node",
+    node_name: str,
+    discovered_topics: Dict[str, str],
+    discovered_services: Dict[str, str],
+) -> List[Connection]:
+    """
+    rclpyのグラフAPIで1ノード分の接続情報を取得する ('ros2 node info' 相当)。
+    """
+    name, namespace = split_node_name(node_name)
+    connections: List[Connection] = []
+    connections_append = connections.append
+    try:
+        for topic_name, _ in node.get_publisher_names_and_types_by_node(name, namespace):
+            if topic_name in discovered_topics:
+                connections_append(("topic", node_name, topic_name, "publish"))
+        for topic_name, _ in node.get_subscriber_names_and_types_by_node(name, namespace):
+            if topic_name in discovered_topics:
+                connections_append(("topic", topic_name, node_name, "subscribe"))
+        for service_name, _ in node.get_service_names_and_types_by_node(name, namespace):
+            if service_name in discovered_services:
+                connections_append(("service", service_name, node_name, "provide"))
+        for service_name, _ in node.get_client_names_and_types_by_node(name, namespace):
+            if service_name in discovered_services:
+                connections_append(("service", node_name, service_name, "call"))
+    except Exception:
+        # NodeNameNonExistentError: 問い合わせ中にノードが終了した場合
+        print(f"  Node disappeared while collecting connections: {node_name}", file=sys.stderr)
+    return connections
+
+
+def collect_nodes_rclpy(
+    node: "Node",
+    node_list: List[str],
+    skip_nodes: Set[str],
+    discovered_topics: Dict[str, str],
+    discovered_services: Dict[str, str],
+) -> List[tuple[Dict[str, Any], List[Connection]]]:
+    """
+    rclpyで全ノードのパラメータと接続情報を収集する。collect_one_node と同じ形式の結果をノード順に返す。
+    """
+    param_targets = [
+        node_name for node_name in node_list
+        if node_name not in skip_nodes
+        and f"{node_name}/list_parameters" in get_service_names_of_node_rclpy(node, node_name)
+    ]
+    print(f"Getting parameters of {len(param_targets)} nodes...", file=sys.stderr)
+    parameters_by_node = get_parameters_rclpy(node, param_targets)
+
+    return [
+        (
+            build_node_dict(node_name, i, parameters_by_node.get(node_name, [])),
+            get_node_connections_rclpy(node, node_name, discovered_topics, discovered_services),
+        )
+        for i, node_name in enumerate(node_list)
+    ]
+
+
+def collect_ros2_graph_data(verbose: bool = False) -> Dict[str, Any]:
+    """
+    ROS 2のノード、トピック、サービス情報を収集し、JSON構造を構築する。
+    rclpyが使える場合はプロセス内のノード1つで、使えない場合はros2 CLI経由で収集する。
+    """
+
+    # 時間計測の開始
+    start_time = time.time()
+
+    rclpy_node = None
+    if rclpy is not None:
+        rclpy.init()
+        rclpy_node = Node(DUMPER_NODE_NAME)
+        # 起動直後はディスカバリが完了していないため少し待つ
+        time.sleep(RCLPY_DISCOVERY_WAIT_SEC)
+    else:
+        print("rclpy not available: collecting graph via ros2 CLI", file=sys.stderr)
+
+    try:
+        graph_data: Dict[str, Any] = {
+            "graph_metadata": {
+                "created_at": int(time.time() * 1000),
+                "description": "Captured ROS 2 network graph using rclpy" if rclpy_node is not None
+                               else "Captured ROS 2 network graph using subprocess"
+            },
+            "nodes": {},
+            "topics": {},
+            "services": {},
+            "actions": {},
+            "connections": []
         }
 
+        # 1. ノードリストの取得と総数カウント
+        node_list_all = get_node_list_rclpy(rclpy_node) if rclpy_node is not None else get_node_list()
+
+        node_list_filtered = []
+        for n in node_list_all:
+            if not n.startswith('/_ros2cli_') and n != f'/{DUMPER_NODE_NAME}':
+                node_list_filtered.append(n)
+
+        # 2. トピックとサービスのリストを事前に取得 (接続情報構築のため)
+        if rclpy_node is not None:
+            discovered_topics, discovered_services = get_topics_and_services_rclpy(rclpy_node)
+        else:
+            discovered_topics, discovered_services = get_topics_and_services()
+
+        # 3. コンポーネント情報の取得 (コンテナはparam dumpでタイムアウトするためスキップ)
+        print("Getting component info...", file=sys.stderr)
+        if rclpy_node is not None:
+            container_nodes, component_nodes = get_component_info_rclpy(rclpy_node, node_list_filtered)
+        else:
+            container_nodes, component_nodes = get_component_info()
+        print(f"Found {len(container_nodes)} container nodes, {len(component_nodes)} component nodes", file=sys.stderr)
+        skip_nodes = get_param_skip_nodes(node_list_filtered, container_nodes, verbose)
+
+        # 4. ノードごとの情報と接続の収集 / 5, 6. メッセージスキーマの取得
+        # ros2 CLIのサブプロセス待ちが支配的なため、asyncioで並行して実行する
+        node_results, schema_cache = asyncio.run(collect_nodes_and_schemas(
+            rclpy_node, node_list_filtered, skip_nodes, discovered_topics, discovered_services))
+
+        connections: List[Connection] = []
+        connections_extend = connections.extend
+        nodes = graph_data["nodes"]
+        for node_dict, node_connections in node_results:
+            nodes[node_dict["name"]] = node_dict
+            connections_extend(node_connections)
+
+        # 5. トピック情報の構築 (メッセージスキーマの取得)
+        for name, type_name in discovered_topics.items():
+            graph_data["topics"][name] = {
+                "id": name,
+                "name": name,
+                "type": type_name,
+                "message_schema": schema_cache[type_name]
+            }
+
+        # 6. サービス情報の構築 (メッセージスキーマの取得)
+        for name, type_name in discovered_services.items():
+            graph_data["services"][name] = {
+                "id": name,
+                "name": name,
+                "type": type_name,
+                "message_schema": schema_cache[type_name]
+            }
+    finally:
+        if rclpy_node is not None:
+            rclpy_node.destroy_node()
+            rclpy.shutdown()
+
+    # 接続情報は最後に1回だけJSON出力用のdictへ変換する
+    graph_data["connections"] = [
+        {"type": t, "source_id": src, "target_id": dst, "direction": d}
+        for t, src, dst, d in connections
+    ]
+
     # ★ 修正1: 処理終了時間の計測と実行時間の計算
     end_time = time.time()
     duration = end_time - start_time
@@ -384,23 +1092,70 @@ def collect_ros2_graph_data() -> Dict[str, Any]:
 
     return graph_data
 
+def write_indented(f, body: bytes, indent: bytes = b'  ') -> None:
+    """
+    body の2行目以降を indent だけ字下げしてファイルへ書き出す。
+    replace で字下げ済みのコピーを作ると最大のセクションでメモリ使用量が倍になるため、行単位で書き出す。
+    """
+    view = memoryview(body)
+    find = body.find
+    write = f.write
+    start = 0
+    while (end := find(b'\n', start)) != -1:
+        write(view[start:end + 1])
+        write(indent)
+        start = end + 1
+    write(view[start:])
+
+
+def write_graph_data(f, graph_data: Dict[str, Any]) -> None:
+    """
+    グラフデータをセクションごとにシリアライズしてバイナリファイルへ書き出す。
+    巨大な整形済み文字列を一度に作らないよう、書き出したセクションから手放す。
+    orjsonがあればindent=2で整形し、無い場合は整形なし (標準jsonのindentは遅いため) で出力する。
+    """
+    f.write(b'{')
+    for idx, key in enumerate(list(graph_data)):
+        value = graph_data.pop(key)
+        if idx > 0:
+            f.write(b',')
+        if orjson is not None:
+            body = orjson.dumps(value, option=orjson.OPT_INDENT_2)
+            f.write(f'\n  "{key}": '.encode('utf-8'))
+            write_indented(f, body)
+        else:
+            f.write(json.dumps(key).encode('utf-8') + b':')
+            f.write(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+    f.write(b'\n}' if orjson is not None else b'}')
+
+
 def main():
     """
     メイン実行関数。グラフデータを収集し、JSONファイルに保存する。
     """
+    parser = ArgumentParser(description='Dump the running ROS 2 graph (nodes, topics, services, parameters) to ros2_graph_dump.json')
+    parser.add_argument('-v', '--verbose', action='store_true', help="list each node whose param dump is skipped")
+    parser.add_argument('--no-schema-cache', action='store_true',
+                        help=f"neither read nor write the interface schema cache ({_SCHEMA_CACHE_DIR})")
+    args = parser.parse_args()
+
     if 'AMENT_PREFIX_PATH' not in os.environ:
         print("Warning: ROS 2 environment does not appear to be sourced. Command execution may fail.", file=sys.stderr)
 
-    graph_data = collect_ros2_graph_data()
+    if not args.no_schema_cache:
+        load_schema_cache()
+    graph_data = collect_ros2_graph_data(verbose=args.verbose)
 
     # 出力をJSON形式に変更
     file_path = "ros2_graph_dump.json"
     try:
-        with open(file_path, "w") as f:
-            json.dump(graph_data, f, indent=2)
+        with open(file_path, "wb") as f:
+            write_graph_data(f, graph_data)
         print(f"Successfully dumped ROS 2 graph data to {file_path}")
     except IOError as e:
         print(f"Error saving JSON file: {e}", file=sys.stderr)
 
+    save_schema_cache()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file